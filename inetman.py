@@ -18,15 +18,21 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import io
+import errno
 import os
 import sys
 import time
+import select
+import selectors
+import socket
+import struct
 import logging
 import subprocess
-import configparser
 import warnings
-from collections import defaultdict
 import shlex
+import functools
+from typing import NamedTuple
 
 __version__ = VERSION = '0.5'
 
@@ -44,7 +50,7 @@ _LOGGING_LEVELS = {'critical': logging.CRITICAL,
 
 # Where the configuration file resides.
 #CONFIG_DIR = os.path.join('~', '.config', 'runpon')
-CONFIG_DIR = '/opt/inetman'
+CONFIG_DIR = os.environ.get('INETMAN_CONFIG_DIR', '/opt/inetman')
 CONFIG_FILE = os.path.join(CONFIG_DIR, 'inetman.cfg')
 
 # Default values for the configuration file.
@@ -79,6 +85,54 @@ CONFIG_SECTIONS = {
     'runpon': CONFIG_DEFAULTS
 }
 
+# Accepted values for the boolean options (the same as configparser's).
+_BOOLEAN_STATES = {'1': True, 'yes': True, 'true': True, 'on': True,
+                    '0': False, 'no': False, 'false': False, 'off': False}
+
+# Converters applied to the values read from the configuration file;
+# options not listed here are kept as strings.
+_CONFIG_CONVERTERS = {
+    'run_off_if_fails': bool,
+    'run_off_at_exit': bool,
+    'check_interval': int,
+    'check_grace_time': int,
+    'cumulative_time': int,
+    'cumulative_time_slot': int
+}
+
+
+class InetmanConfig(NamedTuple):
+    """Resolved configuration values; the command lines are also
+    available already split, as on_argv and off_argv (empty tuples if
+    they can't be split, e.g. for an unbalanced quote)."""
+    on: str
+    off: str
+    check_interface: str
+    run_off_if_fails: bool
+    run_off_at_exit: bool
+    check_interval: int
+    check_grace_time: int
+    cumulative_time: int
+    cumulative_time_slot: int
+    on_argv: tuple
+    off_argv: tuple
+
+
+# Snapshot of the configuration, so that the polling functions don't have
+# to go through the parser at every check; the parser is only used to
+# read and save the file.
+CFG = None
+
+# rtnetlink bits used to be notified when a network interface shows up
+# (see linux/rtnetlink.h and linux/if_link.h).
+_RTMGRP_LINK = 1
+_RTM_NEWLINK = 16
+_RTM_DELLINK = 17
+_IFLA_IFNAME = 3
+_NLMSG_HDR = struct.Struct('=IHHII')
+_IFINFOMSG_SIZE = 16
+_RTATTR_HDR = struct.Struct('=HH')
+
 # Update the label every X seconds.
 INTERVAL = 1
 
@@ -92,11 +146,87 @@ RUNPON_HELP = """%s [%s] - runs pon/poff scripts.
     --logging-file  file    print logs into the given file.
 
     The configuration settings are stored in %s
+    (the directory can be changed with the INETMAN_CONFIG_DIR environment
+    variable).
 """ % (PRG_NAME, VERSION, CONFIG_FILE)
 
 
-class RunPONConfigParser(configparser.ConfigParser):
-    """Custom configuration parser."""
+class RunPONConfigParser(object):
+    """Custom configuration parser.
+
+    The file only holds flat 'key = value' options grouped in a few
+    sections, so a dictionary of dictionaries is enough to represent it;
+    options missing from a section are searched in the 'DEFAULT' one."""
+    __slots__ = ('_sections', '_activeSection')
+
+    def __init__(self, sections=None):
+        """Initialize the instance.
+
+        *sections*  a {section: {key: value}} dictionary."""
+        self._sections = {'DEFAULT': {}}
+        # Name of the active section, once resolved by getActiveSection.
+        self._activeSection = None
+        for section, options in (sections or {}).items():
+            # Empty sections must be kept, too.
+            target = self._sections.setdefault(section, {})
+            for key, value in options.items():
+                target[key.lower()] = value
+
+    def sections(self):
+        """Return the list of sections, DEFAULT excluded."""
+        return [section for section in self._sections if section != 'DEFAULT']
+
+    def has_section(self, section):
+        """Return True if the section exists (DEFAULT is not considered)."""
+        return section != 'DEFAULT' and section in self._sections
+
+    def add_section(self, section):
+        """Add an empty section, returning False if it already exists."""
+        if section in self._sections:
+            return False
+        self._sections[section] = {}
+        # The active section may exist now.
+        self._activeSection = None
+        return True
+
+    def has_option(self, section, key):
+        """Return True if the key is set in the section or in DEFAULT."""
+        options = self._sections.get(section)
+        if options is None:
+            return False
+        key = key.lower()
+        return key in options or key in self._sections['DEFAULT']
+
+    def get(self, section, key):
+        """Return the value of the key in the given section, falling back
+        to DEFAULT; None is returned if it's not set."""
+        key = key.lower()
+        value = self._sections.get(section, {}).get(key)
+        if value is None:
+            value = self._sections['DEFAULT'].get(key)
+        return value
+
+    def set(self, section, key, value):
+        """Set the value of the key in the given (existing) section."""
+        key = key.lower()
+        self._sections[section][key] = value
+        if key == 'active':
+            self._activeSection = None
+
+    def write(self, fileObj):
+        """Write the configuration to a file-like object, in INI format;
+        '%' is written as '%%', see _unescapePercent."""
+        for section, options in self._sections.items():
+            if section == 'DEFAULT' and not options:
+                continue
+            fileObj.write('[%s]\n' % section)
+            for key, value in options.items():
+                # Escape '%' and indent continuation lines, so that files
+                # remain readable by configparser.
+                value = str(value).replace('%', '%%').replace('\n', '\n\t')
+                fileObj.write('%s = %s\n' % (key, value))
+            fileObj.write('\n')
+
     def getValue(self, key, converter=None, default=None):
         """Return the value of the specified key, looking first into the
         active section (specified with the 'active' option of the 'DEFAULT'
@@ -107,116 +237,315 @@ class RunPONConfigParser(configparser.ConfigParser):
         *default*   the default value to return if the key is not found."""
         if converter is bool and default is None:
             default = False
-        try:
-            active = self.getActiveSection()
-            # Get the value from the active section.
-            value = self.get(active, key)
-            if not value:
-                return default
-            if converter:
-                try:
-                    if converter is bool:
-                        value = self._boolean_states[value.lower()]
-                    else:
-                        value = converter(value)
-                except Exception:
-                    return default
-            return value
-        except ConfigParser.Error:
+        # Get the value from the active section.
+        value = self.get(self.getActiveSection(), key)
+        if not value:
             return default
+        if converter:
+            try:
+                if converter is bool:
+                    if value in _BOOLEAN_STATES:
+                        value = _BOOLEAN_STATES[value]
+                    else:
+                        value = _BOOLEAN_STATES[value.lower()]
+                else:
+                    value = converter(value)
+            except Exception:
+                return default
+        return value
 
     def setValue(self, option, value):
         """Set a value in the active section."""
         active = self.getActiveSection()
         self.set(active, option, value)
+        if option in CONFIG_DEFAULTS and CFG is not None:
+            self.snapshot()
+
+    def getConvertedValue(self, key):
+        """Return the value of the specified key, converted according to
+        _CONFIG_CONVERTERS; CONFIG_DEFAULTS is used as the fall-back."""
+        converter = _CONFIG_CONVERTERS.get(key)
+        default = CONFIG_DEFAULTS[key]
+        if converter is bool:
+            default = _BOOLEAN_STATES[default]
+        elif converter is not None:
+            default = converter(default)
+        return self.getValue(key, converter, default)
+
+    def snapshot(self):
+        """Freeze the converted values of every known option into a new
+        InetmanConfig instance, stored in CFG and returned."""
+        global CFG
+        # The sections may have changed since the last call.
+        self._activeSection = None
+        values = {key: self.getConvertedValue(key)
+                    for key in CONFIG_DEFAULTS.keys()}
+        for key in ('on', 'off'):
+            try:
+                values[key + '_argv'] = _splitCommand(values[key])
+            except ValueError as e:
+                # Don't fail while reading the file: executeCommand
+                # refuses to run an empty command line.
+                logging.warning('unable to parse the %r command line %r: %s',
+                                key, values[key], e)
+                values[key + '_argv'] = ()
+        CFG = InetmanConfig(**values)
+        return CFG
 
     def getActiveSection(self):
-        """Return the active section (DEFAULT is the fall-back option)."""
-        try:
-            # First of all, tries to identify the active section; if it's
-            # not set, falls back to DEFAULT.
-            active = self.get('DEFAULT', 'active')
-            if not self.has_section(active):
-                active = 'DEFAULT'
-        except ConfigParser.Error:
+        """Return the active section (DEFAULT is the fall-back option);
+        the result is cached until the 'active' option is set or a section
+        is added."""
+        if self._activeSection is not None:
+            return self._activeSection
+        # First of all, tries to identify the active section; if it's
+        # not set, falls back to DEFAULT.
+        active = self.get('DEFAULT', 'active')
+        if not active or not self.has_section(active):
             active = 'DEFAULT'
+        self._activeSection = active
         return active
 
     def addSection(self, section):
         """Add a new section, populating it with default values."""
-        try:
-            self.add_section(section)
-        except ConfigParser.DuplicateSectionError:
+        if not self.add_section(section):
             return
         for key, value in CONFIG_DEFAULTS.items():
             self.set(section, key, value)
 
 
+def _readFile(fileName):
+    """Return the content of a (small) file, decoded as UTF-8; the raw file
+    descriptor is read directly, without the buffering of the io stack.
+    Undecodable bytes are preserved as surrogates, and written back as
+    they were by _writeFile."""
+    fd = os.open(fileName, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        chunks = []
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(fd)
+    return b''.join(chunks).decode('utf-8', 'surrogateescape')
+
+
+def _writeFile(fileName, data):
+    """Replace the content of a file with the given string, written as
+    UTF-8; the descriptor is not inherited by the executed commands."""
+    data = memoryview(data.encode('utf-8', 'surrogateescape'))
+    fd = os.open(fileName, os.O_WRONLY | os.O_CREAT | os.O_TRUNC |
+                os.O_CLOEXEC, 0o666)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+
+def _parseIni(data):
+    """Parse, in a single pass, the simple INI syntax of the configuration
+    file, returning a {section: {key: value}} dictionary.  None is returned
+    if anything that needs the whole ConfigParser machinery is found
+    (continuation lines, ':' delimiters, duplicates, options outside of
+    a section); keys are case-insensitive, and returned lowercase."""
+    sections = {}
+    options = None
+    for line in data.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped[0] in '#;':
+            continue
+        if line[0].isspace():
+            return None
+        if stripped[0] == '[':
+            name = stripped[1:-1]
+            if stripped[-1] != ']' or name in sections:
+                return None
+            options = sections[name] = {}
+            continue
+        key, sep, value = stripped.partition('=')
+        key = key.strip().lower()
+        if not sep or options is None or ':' in key or key in options:
+            return None
+        options[key] = value.strip()
+    return sections
+
+
+def _parseIniFull(data):
+    """Parse the configuration file with the configparser module, for the
+    syntax _parseIni doesn't handle; the module is imported only when
+    it's needed."""
+    import configparser
+    # DEFAULT has to be returned like any other section: use an impossible
+    # name for configparser's own default section.
+    parser = configparser.RawConfigParser(default_section='\0')
+    parser.read_string(data)
+    return {section: dict(parser.items(section))
+            for section in parser.sections()}
+
+
+def _unescapePercent(sections):
+    """Turn, in place, the '%%' escapes of the configparser interpolation
+    syntax back into '%'; any other '%' (like in '%(name)s' references)
+    is not interpolated, but used literally, and a warning is logged."""
+    for section, options in sections.items():
+        for key, value in options.items():
+            if '%' not in value:
+                continue
+            if '%' in value.replace('%%', ''):
+                logging.warning('[%s] %s = %s: values are not interpolated',
+                                section, key, value)
+            options[key] = value.replace('%%', '%')
+
+
+# Modification time of the configuration file when it was last read, and
+# the resulting parser.
+_configMTime = None
+_configCache = None
+
+
 def manageConfigFile():
-    """Return a ConfigParser instance, reading values from a file and
-    creating it, if it doesn't exist."""
+    """Return a RunPONConfigParser instance, reading values from a file and
+    creating it (or adding the missing options), if needed.  The file is
+    parsed again only if it was modified since the last call."""
+    global _configMTime, _configCache
     confFN = os.path.expanduser(CONFIG_FILE)
-    _creating = False
-    _gotFile = True
     try:
-        cfgFile = open(confFN)
-    except (IOError, OSError):
-        # We're trying to create the file.
-        _creating = True
-        try:
-            os.makedirs(os.path.expanduser(CONFIG_DIR))
-        except (IOError, OSError):
-            pass
-        try:
-            cfgFile = open(confFN, 'w+')
-        except (IOError, OSError):
-            # Uh-oh! We can't get a file - go on with the default values.
-            _gotFile = False
-    config = RunPONConfigParser()
-    if _gotFile:
-        config.readfp(cfgFile)
-    if _creating:
-        # Populate the new configuration object.
-        for section, options in CONFIG_SECTIONS.items():
-            if section != 'DEFAULT':
-                config.add_section(section)
-            for key, value in options.items():
+        mtime = os.stat(confFN).st_mtime_ns
+    except OSError:
+        mtime = None
+    if _configCache is not None and mtime is not None \
+            and mtime == _configMTime:
+        return _configCache
+    # The file is written only if we're creating it, or if it could be
+    # read: the defaults must never overwrite an existing file.
+    writable = True
+    try:
+        data = _readFile(confFN)
+    except FileNotFoundError:
+        data = ''
+    except OSError as e:
+        logging.warning('unable to read %s, using the default values: %s',
+                        confFN, e)
+        data = ''
+        writable = False
+    sections = _parseIni(data)
+    if sections is None:
+        sections = _parseIniFull(data)
+    _unescapePercent(sections)
+    config = RunPONConfigParser(sections)
+    # Populate what's missing: everything, if we're creating the file.
+    dirty = False
+    for section, options in CONFIG_SECTIONS.items():
+        created = False
+        if section != 'DEFAULT' and not config.has_section(section):
+            config.add_section(section)
+            created = True
+        for key, value in options.items():
+            if created or not config.has_option(section, key):
                 config.set(section, key, value)
-        if _gotFile:
+                dirty = True
+    if dirty and writable:
+        try:
+            os.makedirs(os.path.expanduser(CONFIG_DIR), exist_ok=True)
+            cfgFile = io.StringIO()
             config.write(cfgFile)
+            _writeFile(confFN, cfgFile.getvalue())
+            mtime = os.stat(confFN).st_mtime_ns
+        except (IOError, OSError):
+            # Uh-oh! We can't write the file - go on with these values.
+            mtime = None
+    config.snapshot()
+    _configMTime = mtime
+    _configCache = config if mtime is not None else None
     return config
 
 
-def get_status_output(*args, **kwargs):
+def reload_config():
+    """Read the configuration file again, refreshing the snapshot
+    of the values."""
+    global config
+    config = manageConfigFile()
+    return config
+
+
+def get_status_output(*args, capture=False, **kwargs):
+    """Run a command with subprocess.run, returning a (status, output) tuple.
+    The output is discarded (and None is returned) unless *capture* is
+    True; explicit stdout/stderr keyword arguments take precedence."""
+    stream = subprocess.PIPE if capture else subprocess.DEVNULL
+    kwargs.setdefault('stdout', stream)
+    kwargs.setdefault('stderr', stream)
     p = subprocess.run(*args, **kwargs)
     return p.returncode, p.stdout
 
 
 
+@functools.lru_cache(maxsize=16)
+def _splitCommand(cmdLine):
+    """Return the argv tuple of a command line; the result is cached, since
+    the same few command lines are executed over and over."""
+    return tuple(shlex.split(cmdLine))
+
+
+# Redirect the standard output and error of the spawned commands to
+# /dev/null: the output of the 'on' and 'off' commands is not used.
+_SPAWN_FILE_ACTIONS = [
+    (os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0),
+    (os.POSIX_SPAWN_DUP2, 1, 2)
+]
+
+
 def executeCommand(cmdLine, _force=False):
-    """Execute the given command line, returning a (status, output) tuple.
+    """Execute the given command line (a string or an argv list), returning
+    a (status, output) tuple; the output is discarded, so it's None.
     If an exception is caught, status is set to None and output to a string
-    representing the exception.  If _force is True the command is executed
-    even if DONT_RUN is True."""
+    representing the exception; failures are logged as warnings, since
+    the output of the command is not available.  If _force is True the
+    command is executed even if DONT_RUN is True."""
+    cmdText = cmdLine if isinstance(cmdLine, str) else shlex.join(cmdLine)
     if DONT_RUN and not _force:
-        logging.info('I WOULD RUN %s' % cmdLine)
+        logging.info('I WOULD RUN %s', cmdText)
         return 0, ''
     try:
-        status, output = get_status_output(shlex.split(cmdLine))
+        if isinstance(cmdLine, str):
+            cmdLine = _splitCommand(cmdLine)
+        if cmdLine:
+            # posix_spawn doesn't have to duplicate the address space of the
+            # daemon, like fork() does.
+            pid = os.posix_spawnp(cmdLine[0], cmdLine, os.environ,
+                                file_actions=_SPAWN_FILE_ACTIONS)
+            status = os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+            output = None
+        else:
+            status, output = None, 'empty command line'
     except Exception as e:
         status, output = None, str(e)
+    if status is None:
+        logging.warning('unable to run %r: %s', cmdText, output)
+    elif status != 0:
+        logging.warning('%r exited with status %d', cmdText, status)
     return status, output
 
 
+@functools.total_ordering
 class Timer(object):
-    """Keep track of the elapsed time."""
+    """Keep track of the elapsed time.
+
+    Every query accepts an optional *now* argument: a time.monotonic()
+    value sampled by the caller, so that a single clock reading can be
+    shared by all the queries of an iteration.  Numeric comparisons use
+    the integer elapsed time stored by the last call to tick()."""
     # Today is the first day of... the Epoch.
     _timeZero = time.gmtime(0)
 
     def __init__(self, initSec=None, running=False, format='%H:%M:%S'):
         """Initialize the Timer instance.
 
-        *initSec*   float representation of time (current time, if None).
+        *initSec*   time.monotonic() representation of the starting time
+                    (current time, if None).
         *running*   the timer is running? (False by default).
         *format*    format of the displayed time."""
         self.running = running
@@ -224,22 +553,53 @@ class Timer(object):
             self.reset()
         else:
             self.initSec = initSec
+            self.tick()
         self.format = format
-
-    def getTime(self, format=None):
+        # A nice '00:00:00' or something like that.
+        self._fmt_zero = time.strftime(format, self._timeZero)
+        # The default format can be built without strftime; the last
+        # string is kept until the elapsed second changes.
+        self._fast = format == '%H:%M:%S'
+        self._lastSecs = None
+        self._lastTime = None
+
+    def tick(self, now=None):
+        """Store (and return) the elapsed time as an integer, for the
+        numeric comparisons."""
+        self._last_int = int(self.elapsed(now))
+        return self._last_int
+
+    def elapsed(self, now=None):
+        """Return the elapsed time, in seconds."""
+        if now is None:
+            now = time.monotonic()
+        return now - self.initSec
+
+    def getTime(self, format=None, now=None):
         """Return the elapsed time in the specified format."""
         if format is None:
+            if not self.running:
+                return self._fmt_zero
+            if self._fast:
+                secs = int(self.elapsed(now))
+                if secs != self._lastSecs:
+                    mins, sec = divmod(secs, 60)
+                    hours, mins = divmod(mins, 60)
+                    # Like strftime on a gmtime() value, hours wrap at 24.
+                    self._lastTime = '%02d:%02d:%02d' % (hours % 24, mins, sec)
+                    self._lastSecs = secs
+                return self._lastTime
             format = self.format
         if self.running:
-            diffTime = time.gmtime(float(self))
+            diffTime = time.gmtime(self.elapsed(now))
         else:
-            # A nice '00:00:00' or something like that.
             diffTime = self._timeZero
         return time.strftime(format, diffTime)
 
     def reset(self):
         """Reset the timer."""
-        self.initSec = time.time()
+        self.initSec = time.monotonic()
+        self._last_int = 0
 
     def start(self):
         """Start the timer."""
@@ -267,72 +627,251 @@ class Timer(object):
 
     def __int__(self):
         """Return the elapsed time as an integer."""
-        return int(time.time() - self.initSec)
+        return int(self.elapsed())
 
     def __float__(self):
         """Return the elapsed time as a float."""
-        return time.time() - self.initSec
+        return self.elapsed()
+
+    # Numeric comparisons.
+    def __lt__(self, other):
+        return self._last_int < other
+
+    def __eq__(self, other):
+        return self._last_int == other
 
-    def __cmp__(self, other):
-        """Numeric comparisons."""
-        _fs = float(self)
-        if _fs < other:
-            return -1
-        if _fs > other:
-            return 1
-        return 0
+    # Defining __eq__ would make instances unhashable.
+    __hash__ = object.__hash__
 
 
-class Observable(defaultdict):
+class Observable(object):
     """Event dispatcher.  Not-so-loosely based on:
     http://en.wikipedia.org/wiki/Observer_pattern ."""
-    def __init__(self, *args, **kwds):
+    __slots__ = ('_subs',)
+
+    def __init__(self):
         """Initialize the instance."""
-        # Values are assumed to be Python objects (callables, hopefully).
-        super(Observable, self).__init__(object, *args, **kwds)
+        # Subscribers are assumed to be callables.
+        self._subs = []
 
     def register(self, subscriber):
         """Register a new subscriber to this event."""
-        self[subscriber]
+        if subscriber not in self._subs:
+            self._subs.append(subscriber)
 
     def notify(self, *args, **kwds):
-        """Notify every subscriber of the event, storing the result."""
-        for subscriber in self:
-            # XXX: so far, storing the return is useless.
-            #      Catch every exception?
-            self[subscriber] = subscriber(*args, **kwds)
-
-
-def connect(wait=False):
-    if not connected():
-        executeCommand(config.getValue('on', None, 'pon'))
-        while wait and not connected(timeout=20):
+        """Notify every subscriber of the event."""
+        # XXX: catch every exception?
+        for subscriber in self._subs:
+            subscriber(*args, **kwds)
+
+
+def connect(wait=False, cfg=None):
+    """Run the 'on' command, if the interface is not up; *cfg* is the
+    InetmanConfig to use (CFG, if None)."""
+    if cfg is None:
+        cfg = CFG
+    if not wait_for_iface(cfg.check_interface, timeout=1):
+        executeCommand(cfg.on_argv)
+        while wait and not wait_for_iface(cfg.check_interface, timeout=20):
             pass
 
 
-def disconnect():
-    if connected():
-        executeCommand(config.getValue('off', None, 'poff'))
+def disconnect(cfg=None):
+    """Run the 'off' command, if the interface is up; *cfg* is the
+    InetmanConfig to use (CFG, if None)."""
+    if cfg is None:
+        cfg = CFG
+    if wait_for_iface(cfg.check_interface, timeout=1):
+        executeCommand(cfg.off_argv)
 
 
-def wait_for_iface(dev, timeout=20, interval=1.0):
-    # Check sysfs presence to avoid racing netifd
-    path = f"/sys/class/net/{dev}"
-    deadline = time.time() + timeout
-    while time.time() < deadline:
-        if os.path.exists(path):
-            return True
-        time.sleep(interval)
-    return False
+def _openLinkSocket():
+    """Return a netlink socket subscribed to the link notifications,
+    or None if they are not available on this system."""
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                            socket.NETLINK_ROUTE)
+    except (AttributeError, OSError):
+        return None
+    try:
+        sock.bind((0, _RTMGRP_LINK))
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def _linkNames(data, msgType=_RTM_NEWLINK):
+    """Yield the names of the interfaces announced by the messages of the
+    given type (RTM_NEWLINK, by default) contained in a netlink datagram."""
+    offset = 0
+    while offset + _NLMSG_HDR.size <= len(data):
+        msgLen, thisType = _NLMSG_HDR.unpack_from(data, offset)[:2]
+        if msgLen < _NLMSG_HDR.size:
+            break
+        if thisType == msgType:
+            end = min(offset + msgLen, len(data))
+            attr = offset + _NLMSG_HDR.size + _IFINFOMSG_SIZE
+            while attr + _RTATTR_HDR.size <= end:
+                attrLen, attrType = _RTATTR_HDR.unpack_from(data, attr)
+                if attrLen < _RTATTR_HDR.size:
+                    break
+                if attrType == _IFLA_IFNAME:
+                    name = data[attr + _RTATTR_HDR.size:attr + attrLen]
+                    yield name.rstrip(b'\0').decode('ascii', 'replace')
+                attr += (attrLen + 3) & ~3
+        offset += (msgLen + 3) & ~3
+
+
+def _recvLinks(sock, msgType=_RTM_NEWLINK):
+    """Receive a datagram from a link notifications socket, returning the
+    list of interfaces announced by the messages of the given type; None
+    is returned if the socket buffer overflowed and some notifications
+    were lost, so the state of the interfaces is unknown."""
+    try:
+        data = sock.recv(65536)
+    except OSError as e:
+        if e.errno != errno.ENOBUFS:
+            raise
+        return None
+    return list(_linkNames(data, msgType))
+
+
+def _presentIface(devs):
+    """Return the first of the given interfaces that exists, or None."""
+    for dev in devs:
+        # Check sysfs presence to avoid racing netifd
+        if os.path.exists(f"/sys/class/net/{dev}"):
+            return dev
+    return None
+
+
+def wait_for_iface(devs, timeout=20, interval=1.0):
+    """Wait for one of the given interfaces to show up, returning the name
+    of the first one found (None, if the timeout expires).
+
+    *devs*      an interface name, or a list of names.
+    *timeout*   seconds to wait.
+    *interval*  seconds between checks, if netlink is not available."""
+    if isinstance(devs, str):
+        devs = (devs,)
+    dev = _presentIface(devs)
+    if dev is not None:
+        return dev
+    deadline_ns = time.monotonic_ns() + int(timeout * 1e9)
+    sock = _openLinkSocket()
+    if sock is None:
+        # No netlink: fall back to polling sysfs.
+        while time.monotonic_ns() < deadline_ns:
+            time.sleep(interval)
+            dev = _presentIface(devs)
+            if dev is not None:
+                return dev
+        return None
+    with sock:
+        # The interface may have appeared before we subscribed.
+        dev = _presentIface(devs)
+        if dev is not None:
+            return dev
+        # A single subscription covers every device: each datagram can
+        # carry the notifications for any number of them.
+        while True:
+            remaining_ns = deadline_ns - time.monotonic_ns()
+            if remaining_ns <= 0:
+                return None
+            ready, _, _ = select.select([sock], [], [],
+                                        remaining_ns / 1e9)
+            if not ready:
+                continue
+            names = _recvLinks(sock)
+            if names is None:
+                # Notifications were lost: look at sysfs.
+                dev = _presentIface(devs)
+                if dev is not None:
+                    return dev
+                continue
+            for name in names:
+                if name in devs:
+                    return name
 
 
 def connected(timeout=1):
-    return wait_for_iface(config.getValue('check_interface'), timeout=timeout)
+    return wait_for_iface(CFG.check_interface, timeout=timeout)
+
+
+def monitor():
+    """Bring the connection up and keep it alive.
+
+    The interface is checked every check_interval seconds and as soon as
+    the kernel reports that it's gone; no check is performed in the first
+    check_grace_time seconds of a connection: a check due in that time is
+    performed as soon as it ends.  A single selector waits for both
+    events, so nothing runs between checks.
+
+    The configuration is frozen, so its values are bound to local names
+    once: the loop doesn't look them up again at every wake-up, and it
+    uses a single snapshot even if CFG is replaced meanwhile."""
+    cfg = CFG
+    interface = cfg.check_interface
+    interval = cfg.check_interval
+    grace = cfg.check_grace_time
+    monotonic = time.monotonic
+    timer = Timer()
+    sel = selectors.DefaultSelector()
+    sock = _openLinkSocket()
+    if sock is not None:
+        sel.register(sock, selectors.EVENT_READ)
+    try:
+        connect(cfg=cfg)
+        timer.restart()
+        nextCheck = timer.initSec + interval
+        # A check is pending until it's performed (after the grace time).
+        pending = False
+        while True:
+            wakeUp = nextCheck
+            if pending:
+                wakeUp = min(wakeUp, timer.initSec + grace)
+            events = sel.select(max(wakeUp - monotonic(), 0))
+            now = monotonic()
+            for key, _ in events:
+                names = _recvLinks(key.fileobj, _RTM_DELLINK)
+                # If notifications were lost, the interface may be gone.
+                if names is None or interface in names:
+                    pending = True
+            if now >= nextCheck:
+                nextCheck = now + interval
+                pending = True
+            # The float elapsed time is used here: the integer one compared
+            # by the Timer would keep the selector spinning until the second
+            # after the end of the grace time.
+            if not pending or timer.elapsed(now) < grace:
+                continue
+            pending = False
+            if wait_for_iface(interface, timeout=1):
+                continue
+            logging.info('interface %s is down', interface)
+            if cfg.run_off_if_fails:
+                executeCommand(cfg.off_argv)
+            timer.stop()
+            connect(cfg=cfg)
+            timer.restart()
+            nextCheck = timer.initSec + interval
+    finally:
+        sel.close()
+        if sock is not None:
+            sock.close()
+        if timer.running and cfg.run_off_at_exit:
+            executeCommand(cfg.off_argv)
+
+
+config = manageConfigFile()
 
 
 if __name__ == '__main__':
     """Things to do when called by the command line."""
     import getopt
+    import signal
     try:
         optList, args = getopt.getopt(sys.argv[1:], 'h',
                             ['logging-level=', 'logging-file=', 'help'])
@@ -362,6 +901,11 @@ if __name__ == '__main__':
                 format='%(asctime)s %(levelname)s: %(message)s',
                 datefmt='%Y-%m-%d %H:%M:%S')
     else:
-        logging.basicConfig(filename=CONFIG_FILE)
-
-config = manageConfigFile()
+        # Log to stderr: never append messages to the configuration file.
+        logging.basicConfig()
+    # Let the 'off' command run at exit, if needed.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        monitor()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,190 @@
+"""Tests for inetman."""
+
+import io
+import os
+import time
+import struct
+import tempfile
+import configparser
+import unittest
+
+# The configuration file is read (and created) at import time: keep it
+# away from the host.
+_CONFIG_DIR = tempfile.TemporaryDirectory()
+os.environ['INETMAN_CONFIG_DIR'] = _CONFIG_DIR.name
+
+import inetman
+
+
+def tearDownModule():
+    _CONFIG_DIR.cleanup()
+
+
+def _write(config):
+    """Return the configuration serialized by RunPONConfigParser.write."""
+    out = io.StringIO()
+    config.write(out)
+    return out.getvalue()
+
+
+class ConfigRoundTripTest(unittest.TestCase):
+    """parse -> write -> parse must give back the same sections."""
+
+    def test_shipped_file(self):
+        fileName = os.path.join(os.path.dirname(__file__), 'inetman.cfg')
+        with open(fileName) as cfgFile:
+            data = cfgFile.read()
+        sections = inetman._parseIni(data)
+        self.assertIsNotNone(sections)
+        written = _write(inetman.RunPONConfigParser(sections))
+        self.assertEqual(inetman._parseIni(written), sections)
+        # The output is the same configparser would produce.
+        stdParser = configparser.ConfigParser()
+        stdParser.read_string(data)
+        stdOut = io.StringIO()
+        stdParser.write(stdOut)
+        self.assertEqual(written, stdOut.getvalue())
+
+    def test_multiline_value(self):
+        data = '[DEFAULT]\nactive = runpon\n\n[runpon]\non = ifup\n  wan\n'
+        self.assertIsNone(inetman._parseIni(data))
+        sections = inetman._parseIniFull(data)
+        self.assertEqual(sections['runpon']['on'], 'ifup\nwan')
+        written = _write(inetman.RunPONConfigParser(sections))
+        self.assertEqual(inetman._parseIniFull(written), sections)
+
+    def test_percent_escapes(self):
+        data = '[runpon]\non = date +%%s\n'
+        sections = inetman._parseIni(data)
+        inetman._unescapePercent(sections)
+        self.assertEqual(sections['runpon']['on'], 'date +%s')
+        written = _write(inetman.RunPONConfigParser(sections))
+        self.assertEqual(written, data + '\n')
+
+
+class RunPONConfigParserTest(unittest.TestCase):
+
+    def test_empty_active_section(self):
+        data = '[DEFAULT]\nactive = foo\non = pon\n\n[foo]\n'
+        config = inetman.RunPONConfigParser(inetman._parseIni(data))
+        self.assertEqual(config.getActiveSection(), 'foo')
+        self.assertEqual(config.getValue('on'), 'pon')
+        self.assertIn('[foo]', _write(config))
+
+    def test_active_section_cache(self):
+        config = inetman.RunPONConfigParser({
+            'DEFAULT': {'active': 'runpon', 'on': 'default'},
+            'runpon': {'on': 'runpon'}})
+        self.assertEqual(config.getValue('on'), 'runpon')
+        config.set('DEFAULT', 'active', 'foo')
+        self.assertEqual(config.getValue('on'), 'default')
+        config.add_section('foo')
+        config.set('foo', 'on', 'foo')
+        self.assertEqual(config.getValue('on'), 'foo')
+
+
+class ManageConfigFileTest(unittest.TestCase):
+
+    def setUp(self):
+        inetman._configCache = inetman._configMTime = None
+        if os.path.isdir(inetman.CONFIG_FILE):
+            os.rmdir(inetman.CONFIG_FILE)
+        elif os.path.exists(inetman.CONFIG_FILE):
+            os.remove(inetman.CONFIG_FILE)
+
+    def _writeConfig(self, data, mtime=10 ** 9):
+        with open(inetman.CONFIG_FILE, 'w') as cfgFile:
+            cfgFile.write(data)
+        # A known modification time, to detect the rewrites.
+        os.utime(inetman.CONFIG_FILE, ns=(mtime, mtime))
+
+    def _readConfig(self):
+        with open(inetman.CONFIG_FILE) as cfgFile:
+            return cfgFile.read()
+
+    def test_creates_file(self):
+        config = inetman.manageConfigFile()
+        self.assertEqual(self._readConfig(), _write(config))
+        self.assertEqual(config.sections(), ['runpon'])
+        self.assertEqual(inetman.CFG.check_interval, 1800)
+
+    def test_complete_file_not_rewritten(self):
+        data = _write(inetman.manageConfigFile()).replace(
+            'check_interval = 1800', 'check_interval = 60')
+        inetman._configCache = None
+        self._writeConfig(data)
+        inetman.manageConfigFile()
+        self.assertEqual(os.stat(inetman.CONFIG_FILE).st_mtime_ns, 10 ** 9)
+        self.assertEqual(self._readConfig(), data)
+        self.assertEqual(inetman.CFG.check_interval, 60)
+
+    def test_missing_option_added(self):
+        self._writeConfig('[DEFAULT]\nactive = runpon\n\n'
+                            '[runpon]\non = ifup wan\n')
+        config = inetman.manageConfigFile()
+        data = self._readConfig()
+        self.assertIn('check_grace_time = 900', data)
+        self.assertIn('on = ifup wan', data)
+        self.assertEqual(config.getValue('on'), 'ifup wan')
+
+    def test_mtime_cache(self):
+        self._writeConfig(_write(inetman.manageConfigFile()))
+        config = inetman.manageConfigFile()
+        self.assertIs(inetman.manageConfigFile(), config)
+        os.utime(inetman.CONFIG_FILE, ns=(2 * 10 ** 9, 2 * 10 ** 9))
+        self.assertIsNot(inetman.manageConfigFile(), config)
+
+    def test_unreadable_file(self):
+        os.mkdir(inetman.CONFIG_FILE)
+        with self.assertLogs(level='WARNING'):
+            inetman.manageConfigFile()
+        self.assertTrue(os.path.isdir(inetman.CONFIG_FILE))
+        self.assertEqual(inetman.CFG.on, 'pon')
+
+
+def _nlmsg(msgType, name):
+    """Return a netlink message of the given type for an interface."""
+    # An IFLA_MTU attribute first, to be skipped.
+    attrs = struct.pack('=HHI', 8, 4, 1500)
+    name = name.encode('ascii') + b'\0'
+    attrs += struct.pack('=HH', 4 + len(name), inetman._IFLA_IFNAME) + name
+    attrs += b'\0' * (-len(attrs) % 4)
+    body = b'\0' * inetman._IFINFOMSG_SIZE + attrs
+    return inetman._NLMSG_HDR.pack(inetman._NLMSG_HDR.size + len(body),
+                                    msgType, 0, 0, 0) + body
+
+
+class LinkNamesTest(unittest.TestCase):
+
+    def test_message_types(self):
+        data = (_nlmsg(inetman._RTM_NEWLINK, 'ppp0') +
+                _nlmsg(inetman._RTM_DELLINK, '3g-wan') +
+                _nlmsg(inetman._RTM_NEWLINK, 'eth10'))
+        self.assertEqual(list(inetman._linkNames(data)), ['ppp0', 'eth10'])
+        self.assertEqual(list(inetman._linkNames(data, inetman._RTM_DELLINK)),
+                        ['3g-wan'])
+
+    def test_truncated_data(self):
+        data = _nlmsg(inetman._RTM_NEWLINK, 'ppp0')
+        for size in range(len(data)):
+            # Must not raise.
+            list(inetman._linkNames(data[:size]))
+
+
+class TimerTest(unittest.TestCase):
+
+    def test_fast_path_matches_strftime(self):
+        timer = inetman.Timer(initSec=0, running=True)
+        for secs in (0, 1, 59.9, 61, 3599, 3600, 86399, 90061, 10 ** 6):
+            self.assertEqual(timer.getTime(now=secs),
+                            time.strftime('%H:%M:%S', time.gmtime(secs)))
+
+    def test_stopped_and_custom_format(self):
+        timer = inetman.Timer(initSec=0)
+        self.assertEqual(timer.getTime(now=100), '00:00:00')
+        timer = inetman.Timer(initSec=0, running=True, format='%M.%S')
+        self.assertEqual(timer.getTime(now=125), '02.05')
+
+
+if __name__ == '__main__':
+    unittest.main()